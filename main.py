@@ -26,6 +26,15 @@ The Rules:
 """
 
 import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import email.utils
+import functools
+import multiprocessing
+import os
+import pickle
 from typing import Optional, Dict, Any, Union, List
 import aiohttp
 from pydantic import BaseModel, Field
@@ -33,19 +42,59 @@ import json
 import re
 import urllib.parse
 import random
+import time
 import xml.etree.ElementTree as ET
 
 try:
-    import html2text
-except ImportError as e:  # pragma: no cover
-    import lxml  # pragma: no cover
+    # libxml2-backed: the page is parsed once in C and the text read straight
+    # off the tree, instead of regex passes plus a pure-Python converter.
+    from lxml import etree as lxml_etree
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover
+    lxml_etree = lxml_html = None
+
+try:
+    # Rust/SIMD JSON parser; accepts str directly, raises a JSONDecodeError
+    # subclass, so it is a drop-in replacement for json.loads here.
+    from orjson import loads as json_loads
+except ImportError:  # pragma: no cover
+    json_loads = json.loads
 
-    class html2text:  # pragma: no cover
-        @staticmethod
-        def html2text(html: str) -> str:  # pragma: no cover
-            plain_text = lxml.etree.HTML(html.encode("utf-8")).xpath("//text()")
-            return " ".join(plain_text)
+try:
+    # C-backed parser, much faster than html2text on large pages. Prefer the
+    # lexbor backend; older selectolax releases only ship Modest.
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:  # pragma: no cover
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+
+try:
+    # c-ares resolver: lookups run concurrently on the loop instead of
+    # queueing for getaddrinfo in the thread pool.
+    import aiodns  # noqa: F401
+except ImportError:  # pragma: no cover
+    aiodns = None
 
+try:
+    from aiohttp import compression_utils as _aiohttp_codecs
+except ImportError:  # pragma: no cover (aiohttp < 3.9)
+    _aiohttp_codecs = None
+
+# Only advertise encodings aiohttp can actually decode in this install;
+# zstd/br need the optional backports.zstd/brotli packages.
+ACCEPT_ENCODING = ", ".join(
+    name
+    for name, available in (
+        ("zstd", getattr(_aiohttp_codecs, "HAS_ZSTD", False)),
+        ("br", getattr(_aiohttp_codecs, "HAS_BROTLI", False)),
+        ("gzip", True),
+        ("deflate", True),
+    )
+    if available
+)
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
@@ -53,7 +102,7 @@ HEADERS = {
     "User-Agent": USER_AGENT,
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
     "Accept-Language": "en-US,en;q=0.5",
-    "Accept-Encoding": "gzip, deflate, br",
+    "Accept-Encoding": ACCEPT_ENCODING,
     "Connection": "keep-alive",
     "Upgrade-Insecure-Requests": "1",
     "Sec-Fetch-Dest": "document",
@@ -65,6 +114,110 @@ HEADERS = {
     "Pragma": "no-cache",
 }
 
+# Connection pool defaults for the shared ClientSession (see Valves).
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 10
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 75
+# Upper bound (seconds) on acquiring a connection, within the valve timeout.
+CONNECT_TIMEOUT = 3
+
+# Body streaming: chunk size, and hard ceiling when max_body_bytes is unset.
+READ_CHUNK_BYTES = 64 * 1024
+MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
+
+# Content-Type fragments of responses worth reading; anything else (images,
+# archives, PDFs, ...) is rejected before the body is downloaded.
+TEXT_TYPES = ("text/", "html", "json", "xml", "javascript")
+
+# First retry waits this many seconds; each further retry doubles it. Waits,
+# jitter included, never exceed BACKOFF_MAX.
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# Each wait is stretched by a random 0..BACKOFF_JITTER fraction of itself.
+BACKOFF_JITTER = 0.5
+# Client errors worth retrying; any other 4xx fails on the first attempt.
+RETRYABLE_4XX = frozenset({408, 425, 429})
+# Statuses whose Retry-After header replaces the computed backoff (still
+# capped at BACKOFF_MAX).
+RETRY_AFTER_STATUSES = frozenset({429, 503})
+
+# Budget for the response cache on top of cache_size, in characters of
+# decoded body, so a handful of huge pages can't pin hundreds of MB.
+CACHE_MAX_CHARS = 64 * 1024 * 1024
+
+# Adaptive cache TTLs: JSON/XML API responses live longer than pages, and a
+# page that keeps changing has its TTL halved down to cache_ttl / limit.
+STRUCTURED_TTL_FACTOR = 4
+TTL_SHRINK_LIMIT = 8
+
+# Subtrees dropped before text extraction. strip_tags() is typed to take a
+# list, so this is built once here rather than per page.
+NON_TEXT_TAGS = ["script", "style", "noscript"]
+
+# Progress events waiting for a slow emitter beyond this many are dropped.
+EMIT_QUEUE_SIZE = 256
+
+# Number of URL -> host splits and host routing decisions memoized.
+HOST_CACHE_SIZE = 1024
+# Number of (page, language) -> Wikipedia API URL mappings memoized.
+WIKI_URL_CACHE_SIZE = 4096
+
+# A summary can only use a prefix of a long page, so the extractor first
+# gets SUMMARY_HTML_RATIO characters of HTML per summary character (at least
+# SUMMARY_HTML_MIN); the whole page is converted only if that prefix yields
+# too little text.
+SUMMARY_HTML_RATIO = 32
+SUMMARY_HTML_MIN = 64 * 1024
+
+# Number of HTML -> text conversions memoized by Tools._page_text.
+TEXT_CACHE_SIZE = 64
+
+# Bounded worker pool for CPU-heavy parsing, so large pages don't stall the
+# event loop while other fetches are in flight.
+PARSE_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 4, thread_name_prefix="webscraper-parse"
+)
+# With the parse_processes valve on, HTML -> text conversions of pages at
+# least this large run in worker processes; smaller ones aren't worth the
+# pickling round trip.
+PROCESS_PARSE_BYTES = 128 * 1024
+# Worker processes for those conversions, created on first use. Set to
+# False once the pool proves unusable (e.g. the tool was loaded from source
+# the workers can't import), after which PARSE_POOL is used instead.
+_process_pool: Union[None, bool, concurrent.futures.ProcessPoolExecutor] = None
+# An XML declaration must open the document, so only the head is scanned.
+XML_DECL_RE = re.compile(r"^\s*<\?xml\s")
+XML_SNIFF_CHARS = 64
+# The whole declaration, removed before lxml parses an XHTML page: lxml
+# rejects str input that declares an encoding.
+XML_PROLOG_RE = re.compile(r"\s*<\?xml\b[^>]*>")
+# Cheap sniff: JSON documents we care about are objects or arrays.
+JSON_START_RE = re.compile(r"\s*[\[{]")
+# Boilerplate stripped by _clean_html before text extraction.
+CLEAN_FLAGS = re.S | re.I
+# Anchored: unanchored, a miss retried the leading .* from every offset,
+# which is quadratic in the page size.
+WIKI_PREAMBLE_RE = re.compile(r"\A.*Contents.move to sidebar.hide", CLEAN_FLAGS)
+# Non-greedy, so text between two blocks survives; attributes allowed.
+# One alternation removes <head> and <script> blocks in a single pass; a
+# script inside <head> goes with it. A block left open by a truncated body
+# runs to the end.
+HEAD_SCRIPT_RE = re.compile(r"<(head|script)\b[^>]*>.*?(?:</\1>|\Z)", CLEAN_FLAGS)
+
+# Media types routed straight to a parser without sniffing the body.
+STRUCTURED_TYPES = {
+    "application/json": "json",
+    "text/json": "json",
+    "application/xml": "xml",
+    "text/xml": "xml",
+    # XML on the wire, but a page: summarize it like HTML
+    "application/xhtml+xml": "html",
+}
+
+# Bodies larger than this are JSON/XML-parsed in PARSE_POOL instead of inline.
+THREAD_PARSE_BYTES = 256 * 1024
+
 try:
     from fake_useragent import UserAgent  # pragma: no cover
 
@@ -74,6 +227,165 @@ except Exception as e:
     pass
 
 
+def _clean_html(html: str) -> str:
+    """Strip the Wikipedia sidebar preamble, <head> and <script> blocks."""
+    # Wikipedia page
+    html = WIKI_PREAMBLE_RE.sub("", html)
+    # Scripts and headers
+    html = HEAD_SCRIPT_RE.sub("", html)
+    return html
+
+
+def _get_all_content(html: str) -> str:
+    """
+    Convert HTML to plain text.
+
+    Results are memoized by Tools._page_text, keyed on a digest of the
+    HTML, so repeat summaries of the same body skip this entirely.
+    """
+    if HTMLParser is not None:
+        # The tree already excludes <head> and drops scripts, so the regex
+        # passes over the raw HTML are skipped; the page is parsed once and
+        # only the (much shorter) text is scrubbed of the Wikipedia preamble.
+        tree = HTMLParser(html)
+        # One native pass removes every non-text subtree, instead of a CSS
+        # query followed by a Python-level decompose() per node.
+        tree.strip_tags(NON_TEXT_TAGS)
+        body = tree.body
+        text = body.text(separator=" ", strip=True) if body else ""
+        return WIKI_PREAMBLE_RE.sub("", text)
+    if lxml_html is not None:  # pragma: no cover
+        prolog = XML_PROLOG_RE.match(html)
+        if prolog:
+            html = html[prolog.end() :]
+        try:
+            doc = lxml_html.document_fromstring(html)
+        except lxml_etree.ParserError:
+            return ""  # nothing but whitespace, comments or a prolog
+        lxml_etree.strip_elements(
+            doc, "head", lxml_etree.Comment, *NON_TEXT_TAGS, with_tail=False
+        )
+        text = " ".join(s for s in (t.strip() for t in doc.itertext()) if s)
+        return WIKI_PREAMBLE_RE.sub("", text)
+    # Pure-Python last resort, imported only when no converter above is
+    # installed and a page actually needs converting.
+    import html2text
+
+    return html2text.html2text(_clean_html(html))
+
+
+@functools.lru_cache(maxsize=HOST_CACHE_SIZE)
+def _is_wiki_host(host: str) -> bool:
+    """True for wikipedia.org and any language/mobile subdomain of it."""
+    return host == "wikipedia.org" or host.endswith(".wikipedia.org")
+
+
+@functools.lru_cache(maxsize=HOST_CACHE_SIZE)
+def _url_host(url: str) -> tuple:
+    """
+    Return (scheme, lowercased hostname) of a URL; the host is "" if missing.
+
+    Plain http(s) URLs are sliced directly; anything unusual (userinfo,
+    IPv6 literals, other schemes, tabs/newlines or other control characters
+    that urllib and aiohttp silently drop) goes through urllib.parse, so
+    the host checked here is the host that gets fetched. Memoized, as one
+    URL is looked at by validation, routing and the per-host limit.
+    """
+    if not url.isprintable():
+        scheme = None
+    elif url.startswith("https://"):
+        scheme, start = "https", 8
+    elif url.startswith("http://"):
+        scheme, start = "http", 7
+    else:
+        scheme = None
+    if scheme is not None:
+        end = len(url)
+        for sep in "/?#":
+            i = url.find(sep, start, end)
+            if i != -1:
+                end = i
+        netloc = url[start:end]
+        if "@" not in netloc and "[" not in netloc:
+            return scheme, netloc.partition(":")[0].lower()
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme, parts.hostname or ""
+
+
+def _is_wiki_article(url: str) -> bool:
+    """True for Wikipedia page URLs that should be routed to the API helper."""
+    if not _is_wiki_host(_url_host(url)[1]):
+        return False
+    path = url.partition("?")[0].partition("#")[0]
+    return not path.endswith("/api.php")
+
+
+@functools.lru_cache(maxsize=WIKI_URL_CACHE_SIZE)
+def _wiki_api_url(page: str, lang: str) -> str:
+    """Build the TextExtracts API URL for a page title or article URL."""
+    if _is_wiki_article(page):
+        # Extract last path segment as title
+        page = page.rsplit("/", 1)[-1]
+        page = urllib.parse.unquote(page)
+        page = page.replace("_", " ")
+
+    page = page.title()  # Title Case for Wikipedia
+    title_param = urllib.parse.quote(page)
+    # One title per request on purpose: TextExtracts returns whole-article
+    # extracts for a single page per query (exlimit is lowered to 1), so
+    # batching titles=A|B|C would silently drop every page but the first.
+    # Multiple pages are fetched concurrently by wikipedia() instead.
+    return f"https://{lang}.wikipedia.org/w/api.php?action=query&prop=extracts&explaintext&format=json&titles={title_param}"
+
+
+def _structured_kind(content_type: str, body: str) -> Optional[str]:
+    """
+    Decide whether a response should be parsed as "json", "xml" or neither.
+
+    Explicit JSON/XML media types are trusted outright, as is XHTML being
+    a page rather than a data document. Anything else
+    (text/html included, which APIs often send by mistake) falls back to
+    sniffing the head of the body: an XML declaration or an opening
+    object/array. Ordinary HTML matches neither, so it never pays for a
+    full (failing) parse.
+    """
+    mime = content_type.partition(";")[0].strip().lower()
+    kind = STRUCTURED_TYPES.get(mime)
+    if kind is None and "+" in mime:
+        # application/ld+json, application/rss+xml, ...
+        kind = STRUCTURED_TYPES.get("application/" + mime.rpartition("+")[2])
+    if kind is not None:
+        return None if kind == "html" else kind
+    if XML_DECL_RE.match(body, 0, XML_SNIFF_CHARS):
+        return "xml"
+    if JSON_START_RE.match(body):
+        return "json"
+    return None
+
+
+def _retry_after(headers) -> Optional[float]:
+    """
+    Seconds a Retry-After header asks us to wait, or None if absent/invalid.
+
+    Accepts both forms: delta-seconds and an HTTP date.
+    """
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    value = value.strip()
+    # isdigit() alone accepts non-ASCII digits such as "²"
+    if value.isascii() and value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        # "-0000" dates come back naive, but HTTP dates are always UTC
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+
 class Tools:
     """
     High-level async web scraping utility.
@@ -99,6 +411,13 @@ class Tools:
         - wiki_lang: which wiki language? defaults to "en"
         - deny_hosts: Set a list of denied hosts to scrape from
         - allow_hosts: A list to override deny_hosts.
+        - cache_ttl: seconds to reuse a fetched response; 0 disables caching
+        - cache_size: max cached responses kept (least recently used evicted)
+        - per_host_concurrency: max simultaneous downloads from one host
+        - connection_limit: max open connections in the session's pool
+        - connection_limit_per_host: max open connections to one host
+        - dns_cache_ttl: seconds to cache DNS lookups
+        - parse_processes: convert large pages in worker processes
 
         Outputs: N/A (configuration container)
         """
@@ -138,6 +457,34 @@ class Tools:
             None,
             description="If set, disallow requests to these hostnames (exact match).",
         )
+        cache_ttl: int = Field(
+            300,
+            description="Seconds to reuse a fetched response for the same URL. 0 disables caching.",
+        )
+        cache_size: int = Field(
+            128,
+            description="Max number of responses kept in the cache; least recently used are evicted first.",
+        )
+        per_host_concurrency: int = Field(
+            4,
+            description="Max simultaneous downloads from a single host. 0 disables the limit.",
+        )
+        connection_limit: int = Field(
+            CONNECTION_LIMIT,
+            description="Max open connections in the HTTP connection pool. 0 means unlimited.",
+        )
+        connection_limit_per_host: int = Field(
+            CONNECTION_LIMIT_PER_HOST,
+            description="Max open connections to a single host. 0 means unlimited.",
+        )
+        dns_cache_ttl: int = Field(
+            DNS_CACHE_TTL,
+            description="Seconds to cache DNS lookups for reuse across requests. 0 disables the cache.",
+        )
+        parse_processes: bool = Field(
+            False,
+            description="Convert large pages to text in worker processes, using every core. Falls back to threads if the workers can't load the tool.",
+        )
 
     def __init__(self):
         """
@@ -149,6 +496,51 @@ class Tools:
         self.valves = self.Valves()
         self._session: Optional[aiohttp.ClientSession] = None
         self._applied_snapshot: Optional[tuple] = None
+        # session-affecting valves the current session was built with
+        self._session_snapshot: Optional[tuple] = None
+        self._cache_snapshot: Optional[tuple] = None
+        # (emitter, event) pairs queued by _emit_nowait, drained in order by
+        # a single worker task
+        self._emit_queue: Optional[asyncio.Queue] = None
+        self._emit_worker: Optional[asyncio.Task] = None
+        # session closes scheduled by _ensure_synced
+        self._close_tasks: set = set()
+        # sessions retired with no running loop, left for close()
+        self._retired_sessions: list = []
+        self._headers: Dict[str, str] = HEADERS
+        self._retries = 1
+        self._min_summary_size = 0
+        self._max_summary_size = 0
+        self._max_body_bytes = 0
+        self._range_headers: Optional[Dict[str, str]] = None
+        self._concurrency = 1
+        self._cache_size = 1
+        self._per_host_concurrency = 0
+        self._parse_processes = False
+        self._allow_hosts: frozenset = frozenset()
+        self._deny_hosts: frozenset = frozenset()
+        # host -> Semaphore bounding simultaneous downloads from that host
+        # only hosts with a download running or waiting have an entry:
+        # [semaphore, number of holders and waiters]
+        self._host_sems: Dict[str, list] = {}
+        self._timeout: aiohttp.ClientTimeout = aiohttp.client.DEFAULT_TIMEOUT
+        self._backoffs: tuple = ()
+        # url -> (monotonic timestamp, ttl, body hash, (text, content type)),
+        # in LRU order
+        self._cache: "collections.OrderedDict[str, tuple]" = collections.OrderedDict()
+        # Total length of the bodies held in _cache
+        self._cache_chars = 0
+        # evictions left before _evict_cache sweeps for expired entries
+        self._sweep_countdown = 0
+        # (len, hash) of an HTML body -> its extracted text, in LRU order
+        self._text_cache: "collections.OrderedDict[tuple, str]" = (
+            collections.OrderedDict()
+        )
+        # url -> If-None-Match / If-Modified-Since headers for its cached
+        # body, so an expired entry is revalidated instead of re-downloaded
+        self._validators: Dict[str, Dict[str, str]] = {}
+        # url -> Future shared by concurrent fetches of that url
+        self._inflight: Dict[str, asyncio.Future] = {}
         self._ensure_synced()
 
     # ------------------------ Internal Utilities ------------------------
@@ -164,8 +556,16 @@ class Tools:
             v.max_body_bytes,
             v.concurrency,
             v.wiki_lang,
-            v.allow_hosts,
-            v.deny_hosts,
+            # copied, so in-place edits of the lists still register
+            tuple(v.allow_hosts or ()),
+            tuple(v.deny_hosts or ()),
+            v.cache_ttl,
+            v.cache_size,
+            v.per_host_concurrency,
+            v.connection_limit,
+            v.connection_limit_per_host,
+            v.dns_cache_ttl,
+            v.parse_processes,
         )
 
     async def __aenter__(self):
@@ -183,6 +583,20 @@ class Tools:
         """
         if self._session and not self._session.closed:
             await self._session.close()
+        worker = self._emit_worker
+        if worker is not None and not worker.done():
+            await self._flush_emits()
+            worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await worker
+        self._emit_worker = self._emit_queue = None
+        # Sessions retired by _ensure_synced may still be closing
+        if self._close_tasks:
+            await asyncio.gather(*list(self._close_tasks))
+        retired, self._retired_sessions = self._retired_sessions, []
+        for session in retired:
+            if not session.closed:
+                await session.close()
 
     async def _emit(self, emitter: Any, event: Dict[str, Any]) -> None:
         """
@@ -209,28 +623,262 @@ class Tools:
         except Exception:
             pass
 
-    def _ensure_synced(self):
+    def _emit_nowait(self, emitter: Any, event: Dict[str, Any]) -> None:
+        """
+        Queue an event without waiting on the emitter.
+
+        Used for progress events so a slow emitter stays off the fetch
+        path. Events are delivered in order by one worker task; if
+        EMIT_QUEUE_SIZE events are already waiting, the new one is dropped.
+        _flush_emits waits for anything still queued.
+
+        Inputs:
+        - emitter: same as _emit
+        - event: dict payload
+        Outputs: None
+        """
+        loop = asyncio.get_running_loop()
+        worker = self._emit_worker
+        if worker is None or worker.done() or worker.get_loop() is not loop:
+            self._emit_queue = asyncio.Queue(maxsize=EMIT_QUEUE_SIZE)
+            self._emit_worker = loop.create_task(self._drain_emits(self._emit_queue))
+        with contextlib.suppress(asyncio.QueueFull):
+            self._emit_queue.put_nowait((emitter, event))
+
+    async def _drain_emits(self, queue: asyncio.Queue) -> None:
+        """
+        Worker behind _emit_nowait: deliver queued events until cancelled.
+
+        Inputs:
+        - queue: the queue this worker owns
+        Outputs: None
+        """
+        while True:
+            emitter, event = await queue.get()
+            try:
+                await self._emit(emitter, event)
+            finally:
+                queue.task_done()
+
+    async def _flush_emits(self) -> None:
         """
-        Recreate session when session-affecting valves change.
+        Wait until every event scheduled with _emit_nowait was delivered.
 
         Inputs: none
-        Outputs: None (may schedule/perform session close)
+        Outputs: None
         """
-        snapshot = self._valves_snapshot()
-        if snapshot == self._applied_snapshot:
-            return
+        worker = self._emit_worker
+        if (
+            worker is not None
+            and not worker.done()
+            and worker.get_loop() is asyncio.get_running_loop()
+        ):
+            await self._emit_queue.join()
+
+    async def _page_text(self, html: str) -> str:
+        """
+        Return the plain text of an HTML body, converting it at most once.
+
+        Keyed on (length, hash) of the body rather than the body itself, so
+        the memo never pins whole pages in memory; str caches its hash, and
+        the response cache has already computed it for cached bodies. A hit
+        is answered on the loop without a round trip to PARSE_POOL.
+
+        Inputs:
+        - html: decoded response body
+        Outputs: str
+        """
+        key = (len(html), hash(html))
+        text = self._text_cache.get(key)
+        if text is not None:
+            self._text_cache.move_to_end(key)
+            return text
+        if self._parse_processes and len(html) >= PROCESS_PARSE_BYTES:
+            text = await self._run_in_process(_get_all_content, html)
+        else:
+            text = await self._run_blocking(_get_all_content, html)
+        self._text_cache[key] = text
+        if len(self._text_cache) > TEXT_CACHE_SIZE:
+            self._text_cache.popitem(last=False)
+        return text
+
+    async def _run_blocking(self, func, *args):
+        """
+        Run a CPU-bound callable in PARSE_POOL and await its result.
+
+        Inputs:
+        - func: callable to run off the event loop
+        - args: positional arguments for func
+        Outputs: whatever func returns (exceptions propagate)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(PARSE_POOL, func, *args)
+
+    async def _run_in_process(self, func, *args):
+        """
+        Run a picklable CPU-bound callable in a worker process.
+
+        Pure-Python conversion holds the GIL, so threads alone can't spread
+        it over cores. Workers are spawned, not forked: forking a server
+        mid-loop, with PARSE_POOL threads alive, can deadlock the children.
+        If the pool can't run func (it can't be pickled here or imported by
+        the workers, or the pool broke), it is disabled for the rest of the
+        process and func runs in PARSE_POOL instead. Errors raised by func
+        itself propagate as usual.
+
+        Inputs:
+        - func: module-level callable to run
+        - args: picklable positional arguments for func
+        Outputs: whatever func returns (exceptions propagate)
+        """
+        global _process_pool
+        if _process_pool is not False:
+            try:
+                # Checked up front: once submitted, a pickling failure can't
+                # be told apart from the same exception raised by func.
+                pickle.dumps(func)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                self._disable_process_pool()
+        if _process_pool is None:
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 4,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        if _process_pool is not False:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(_process_pool, func, *args)
+            except concurrent.futures.BrokenExecutor:
+                # A worker died, e.g. unable to import func's module
+                self._disable_process_pool()
+        return await self._run_blocking(func, *args)
+
+    @staticmethod
+    def _disable_process_pool() -> None:
+        """
+        Shut down the worker process pool and stop using it.
 
+        Inputs: none
+        Outputs: None
+        """
+        global _process_pool
+        pool, _process_pool = _process_pool, False
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _retire_session(self) -> None:
+        """
+        Close the current session (if any) so the next fetch builds a new one.
+
+        Inputs: none
+        Outputs: None (may schedule a session close)
+        """
         if self._session and not self._session.closed:
             try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    loop.create_task(self._session.close())
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            try:
+                if loop is not None:
+                    task = loop.create_task(self._session.close())
+                    # keep a reference so the close isn't garbage collected
+                    self._close_tasks.add(task)
+                    task.add_done_callback(self._close_tasks.discard)
                 else:
-                    loop.run_until_complete(self._session.close())
+                    # Called from sync code with no loop. A fresh loop isn't
+                    # the one the connector is bound to, so the close is left
+                    # for close(), which runs on the tool's loop.
+                    self._retired_sessions.append(self._session)
             except Exception:  # pragma: nocover
                 # best-effort; ignore close errors
                 pass
         self._session = None
+
+    def _ensure_synced(self):
+        """
+        Apply valve changes: rebuild derived values, session and cache.
+
+        The session, and with it the keep-alive pool, is only replaced when
+        a valve baked into its connector (pool/DNS settings) changes; a new
+        user agent is written into the live session's headers and the
+        timeout is passed per request. Cached responses are only dropped
+        when the body cap changes or caching is turned off; a new cache_ttl
+        rescales each entry's TTL, and a smaller cache_size just evicts down
+        to the new limit.
+
+        Inputs: none
+        Outputs: None (may schedule a session close)
+        """
+        snapshot = self._valves_snapshot()
+        if snapshot == self._applied_snapshot:
+            return
+
+        v = self.valves
+        session_snapshot = (
+            v.connection_limit,
+            v.connection_limit_per_host,
+            v.dns_cache_ttl,
+        )
+        if session_snapshot != self._session_snapshot:
+            self._retire_session()
+            self._session_snapshot = session_snapshot
+
+        # Values derived from the valves, recomputed only when they change
+        self._retries = max(1, int(v.retries or 0))
+        self._min_summary_size = int(v.min_summary_size or 0)
+        self._max_summary_size = int(v.max_summary_size or 0)
+        self._max_body_bytes = int(v.max_body_bytes or 0)
+        # Best-effort hint so servers that honor Range stop sending at the
+        # cap too; _read_body still enforces it for those that don't.
+        cap = self._max_body_bytes
+        self._range_headers = {"Range": f"bytes=0-{cap - 1}"} if cap else None
+        self._concurrency = max(1, int(v.concurrency or 0))
+        self._cache_size = max(1, int(v.cache_size or 0))
+        per_host = max(0, int(v.per_host_concurrency or 0))
+        if per_host != self._per_host_concurrency:
+            # Only a new limit needs new semaphores; replacing them on any
+            # valve edit would let a running batch exceed the per-host bound.
+            self._per_host_concurrency = per_host
+            self._host_sems = {}
+        self._parse_processes = bool(v.parse_processes)
+        # Hostnames are case-insensitive; _url_host lowercases the other side
+        self._allow_hosts = frozenset(h.lower() for h in v.allow_hosts or ())
+        self._deny_hosts = frozenset(h.lower() for h in v.deny_hosts or ())
+        # Same default the session would apply without a valve
+        self._timeout = aiohttp.client.DEFAULT_TIMEOUT
+        if v.timeout:
+            # Connecting gets its own, shorter budget so dead hosts fail fast
+            # instead of holding a slot for the whole timeout.
+            total = float(v.timeout)
+            connect = min(CONNECT_TIMEOUT, total)
+            self._timeout = aiohttp.ClientTimeout(
+                total=total, connect=connect, sock_connect=connect, sock_read=total
+            )
+        # Exponential backoff delays (before jitter), one per retry
+        self._backoffs = tuple(BACKOFF_BASE * (1 << i) for i in range(self._retries))
+        # Effective request headers
+        ua = v.user_agent
+        self._headers = {**HEADERS, "User-Agent": ua} if ua else HEADERS
+        if self._session is not None and not self._session.closed:
+            # Keep the pool's warm connections; only the header changes
+            self._session.headers["User-Agent"] = self._headers["User-Agent"]
+        # Cached bodies were cut at max_body_bytes; their TTLs derive from
+        # cache_ttl. The user agent doesn't invalidate them: the same URL
+        # serves the same page, and a config reload shouldn't cost the cache.
+        cached = self._cache_snapshot
+        if cached is None or v.max_body_bytes != cached[0] or not v.cache_ttl:
+            # Bodies were cut at the old cap (or caching is now off)
+            self._cache.clear()
+            self._cache_chars = 0
+            self._validators.clear()
+        elif v.cache_ttl != cached[1] and cached[1]:
+            # Entries keep their adaptive TTL, rescaled to the new base
+            scale = v.cache_ttl / cached[1]
+            for url, (ts, ttl, digest, value) in self._cache.items():
+                self._cache[url] = (ts, ttl * scale, digest, value)
+        self._cache_snapshot = (v.max_body_bytes, v.cache_ttl)
+        if len(self._cache) > self._cache_size:
+            self._evict_cache()
         self._applied_snapshot = snapshot
 
     async def _get_session(self) -> aiohttp.ClientSession:
@@ -238,14 +886,383 @@ class Tools:
         self._ensure_synced()
         if self._session and not self._session.closed:
             return self._session
+        # Keep-alive pool with a DNS cache so repeat hosts skip the resolver
+        # and TCP/TLS handshakes are reused across fetches.
         v = self.valves
-        headers = HEADERS.copy()
-        if v.user_agent:
-            headers["User-Agent"] = v.user_agent
-        timeout = aiohttp.ClientTimeout(total=float(v.timeout)) if v.timeout else None
-        self._session = aiohttp.ClientSession(headers=headers, timeout=timeout)
+        dns_ttl = max(0, int(v.dns_cache_ttl or 0))
+        connector = aiohttp.TCPConnector(
+            limit=max(0, int(v.connection_limit or 0)),
+            limit_per_host=max(0, int(v.connection_limit_per_host or 0)),
+            use_dns_cache=bool(dns_ttl),
+            ttl_dns_cache=dns_ttl or None,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            resolver=aiohttp.AsyncResolver() if aiodns is not None else None,
+        )
+        self._session = aiohttp.ClientSession(
+            headers=self._headers, connector=connector
+        )
         return self._session
 
+    async def _fetch(self, url: str, emitter=None) -> tuple:
+        """
+        Fetch a URL through the response cache.
+
+        Each entry carries its own TTL derived from cache_ttl (see
+        _entry_ttl), and the cache is dropped whenever the valves change
+        (see _ensure_synced). Concurrent callers asking for the same URL
+        share a single in-flight download.
+
+        Inputs:
+        - url: target URL
+        - emitter: optional event sink
+        Outputs: (decoded body text, Content-Type header)
+        """
+        ttl = self.valves.cache_ttl
+        # An expired entry stays until it is replaced, so the refetch can
+        # tell whether the page changed (see _entry_ttl).
+        previous = self._cache.get(url)
+        if self._is_fresh(previous):
+            self._cache.move_to_end(url)
+            if emitter:
+                self._emit_nowait(emitter, {"type": "cache_hit", "url": url})
+            return previous[3]
+
+        pending = self._inflight.get(url)
+        if pending is not None:
+            # shield: a cancelled follower must not cancel the shared fetch
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[url] = pending
+        try:
+            async with self._host_slot(url):
+                result = await self._fetch_with_retries(url, emitter=emitter)
+            pending.set_result(result)
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # mark retrieved when nobody else waits
+            raise
+        finally:
+            if not pending.done():
+                pending.cancel()
+            self._inflight.pop(url, None)
+        if ttl:
+            digest = hash(result[0])
+            entry_ttl = self._entry_ttl(ttl, result[1], digest, previous)
+            stale = self._cache.pop(url, None)
+            if stale is not None:
+                self._cache_chars -= len(stale[3][0])
+            self._cache[url] = (time.monotonic(), entry_ttl, digest, result)
+            self._cache_chars += len(result[0])
+            if (
+                len(self._cache) > self._cache_size
+                or self._cache_chars > CACHE_MAX_CHARS
+            ):
+                self._evict_cache()
+        return result
+
+    def _store_validators(self, url: str, headers) -> None:
+        """Remember the ETag/Last-Modified of a body about to be cached."""
+        found = {}
+        if self.valves.cache_ttl:
+            etag = headers.get("ETag")
+            modified = headers.get("Last-Modified")
+            if etag:
+                found["If-None-Match"] = etag
+            if modified:
+                found["If-Modified-Since"] = modified
+        if found:
+            self._validators[url] = found
+        else:
+            self._validators.pop(url, None)
+
+    def _is_fresh(self, entry: Optional[tuple]) -> bool:
+        """True when a cache entry exists and is still within its own TTL."""
+        if entry is None or not self.valves.cache_ttl:
+            return False
+        stored_at, entry_ttl = entry[0], entry[1]
+        return time.monotonic() - stored_at < entry_ttl
+
+    @staticmethod
+    def _entry_ttl(
+        ttl: int, content_type: str, digest: int, previous: Optional[tuple]
+    ) -> float:
+        """
+        Pick the TTL for a freshly fetched cache entry.
+
+        JSON/XML API responses start at STRUCTURED_TTL_FACTOR x cache_ttl,
+        everything else at cache_ttl. On each refresh the TTL halves when
+        the body changed (down to cache_ttl / TTL_SHRINK_LIMIT) and doubles
+        when it didn't (up to the starting value).
+
+        Inputs:
+        - ttl: cache_ttl valve, in seconds
+        - content_type: Content-Type header of the response
+        - digest: hash of the new body
+        - previous: the expired cache entry for this URL, if any
+        Outputs: TTL in seconds
+        """
+        structured = "json" in content_type or "xml" in content_type
+        ceiling = ttl * STRUCTURED_TTL_FACTOR if structured else ttl
+        if previous is None:
+            return ceiling
+        _, previous_ttl, previous_digest, _ = previous
+        if digest != previous_digest:
+            return max(ttl / TTL_SHRINK_LIMIT, previous_ttl / 2)
+        return min(ceiling, previous_ttl * 2)
+
+    def _evict_cache(self) -> None:
+        """
+        Shrink the response cache back to cache_size entries and
+        CACHE_MAX_CHARS of body text.
+
+        Expired entries go first, so live pages aren't evicted while dead
+        ones take up slots; the least recently used entries go after that.
+        Finding the expired ones is a full pass, so it runs on the first
+        eviction and then once per cache_size evictions: O(1) amortized
+        per insert rather than O(n) each time.
+
+        Inputs: none
+        Outputs: None
+        """
+        if self._sweep_countdown > 0:
+            self._sweep_countdown -= 1
+        else:
+            self._sweep_countdown = self._cache_size
+            now = time.monotonic()
+            expired = [
+                k for k, (ts, ttl, _, _) in self._cache.items() if now - ts >= ttl
+            ]
+            for key in expired:
+                self._cache_chars -= len(self._cache.pop(key)[3][0])
+                self._validators.pop(key, None)
+        while self._cache and (
+            len(self._cache) > self._cache_size or self._cache_chars > CACHE_MAX_CHARS
+        ):
+            key, entry = self._cache.popitem(last=False)
+            self._cache_chars -= len(entry[3][0])
+            self._validators.pop(key, None)
+
+    @contextlib.asynccontextmanager
+    async def _host_slot(self, url: str):
+        """
+        Hold one of the per-host download slots for url's host.
+
+        A host's semaphore is dropped once nobody holds or waits for it, so
+        a long-lived instance doesn't keep one for every host it has seen.
+
+        Inputs:
+        - url: target URL
+        Outputs: async context manager (a no-op when the limit is disabled)
+        """
+        if not self._per_host_concurrency:
+            yield
+            return
+        host = _url_host(url)[1]
+        entry = self._host_sems.get(host)
+        if entry is None:
+            sem = asyncio.Semaphore(self._per_host_concurrency)
+            entry = self._host_sems[host] = [sem, 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            # the entry may already be gone if the limit changed meanwhile
+            if not entry[1] and self._host_sems.get(host) is entry:
+                del self._host_sems[host]
+
+    async def _fetch_with_retries(self, url: str, emitter=None) -> tuple:
+        """
+        Download a URL, retrying with jittered exponential backoff.
+
+        When the URL has a cached body with an ETag or Last-Modified, the
+        request is conditional and a 304 answer returns the cached body.
+        A 429/503 carrying Retry-After waits as long as the server asks,
+        up to BACKOFF_MAX.
+
+        Inputs:
+        - url: target URL
+        - emitter: optional event sink
+        Outputs: (decoded body text, Content-Type header)
+        """
+        sess = await self._get_session()
+        retries = self._retries
+        entry = self._cache.get(url)
+        validators = self._validators.get(url) if entry is not None else None
+        request_headers = {**(self._range_headers or {}), **(validators or {})}
+        last_exc = None
+
+        for attempt in range(1, retries + 1):
+            if emitter:
+                self._emit_nowait(
+                    emitter,
+                    {"type": "fetch_attempt", "attempt": attempt, "url": url},
+                )
+            try:
+                async with sess.get(
+                    url, headers=request_headers or None, timeout=self._timeout
+                ) as resp:
+                    status = resp.status
+                    if status == 304 and validators:
+                        if emitter:
+                            self._emit_nowait(
+                                emitter, {"type": "not_modified", "url": url}
+                            )
+                        return entry[3]
+                    if status == 416 and self._range_headers:
+                        # bytes=0-N is only unsatisfiable for an empty body
+                        return "", resp.headers.get("Content-Type", "")
+                    if status >= 400:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info,
+                            resp.history,
+                            status=status,
+                            message="bad status",
+                            headers=resp.headers,
+                        )
+                    if emitter:
+                        self._emit_nowait(
+                            emitter,
+                            {
+                                "type": "fetched",
+                                "status": status,
+                                "url": url,
+                                "encoding": resp.headers.get("Content-Encoding", ""),
+                            },
+                        )
+                    ctype = resp.headers.get("Content-Type", "")
+                    # Don't download images, archives, PDFs, ... at all
+                    if ctype and not any(m in ctype.lower() for m in TEXT_TYPES):
+                        raise ValueError(f"Unsupported content type: {ctype}")
+                    body = await self._read_body(resp)
+                    # Decode according to content-type
+                    charset = None
+                    if "charset=" in ctype:
+                        charset = ctype.split("charset=", 1)[-1].split(";")[0].strip()
+                    text = body.decode(charset or "utf-8", errors="replace")
+                    self._store_validators(url, resp.headers)
+                    return text, ctype
+            except Exception as e:
+                last_exc = e
+                # ValueError flags a permanent problem with the response
+                # (unsupported type, too large), as does a 404/403/...;
+                # retrying can't fix those.
+                permanent = isinstance(e, ValueError) or (
+                    isinstance(e, aiohttp.ClientResponseError)
+                    and 400 <= e.status < 500
+                    and e.status not in RETRYABLE_4XX
+                )
+                if attempt < retries and not permanent:
+                    # status-based retry window
+                    # Proportional jitter spreads out clients that failed
+                    # together, at every step of the backoff.
+                    wait = self._backoffs[attempt - 1] * (
+                        1 + random.random() * BACKOFF_JITTER
+                    )
+                    if (
+                        isinstance(e, aiohttp.ClientResponseError)
+                        and e.status in RETRY_AFTER_STATUSES
+                    ):
+                        # The server said when to come back; trust it
+                        hint = _retry_after(e.headers)
+                        if hint is not None:
+                            wait = hint
+                    wait = min(wait, BACKOFF_MAX)
+                    if emitter:
+                        self._emit_nowait(
+                            emitter,
+                            {
+                                "type": "fetch_retry",
+                                "attempt": attempt,
+                                "wait": wait,
+                                "error": str(e),
+                            },
+                        )
+                    await asyncio.sleep(wait)
+                else:
+                    if emitter:
+                        await self._flush_emits()
+                        await self._emit(
+                            emitter,
+                            {
+                                "type": "fetch_failed",
+                                "attempt": attempt,
+                                "error": str(e),
+                            },
+                        )
+                    break
+        raise Exception(f"Failed to fetch {url}: {last_exc}")
+
+    async def _read_body(self, resp) -> bytes:
+        """
+        Stream a response body, stopping once max_body_bytes is reached.
+
+        Without a max_body_bytes cap, bodies larger than MAX_DOWNLOAD_BYTES
+        are rejected instead of being buffered whole. An uncompressed body
+        whose Content-Length already fits is read in one call instead.
+
+        Inputs:
+        - resp: aiohttp response whose body has not been read yet
+        Outputs: body bytes (truncated to max_body_bytes when set)
+        """
+        cap = self._max_body_bytes
+        length = resp.headers.get("Content-Length")
+        length = int(length) if length and length.isdigit() else None
+        if length is not None:
+            if not cap and length > MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"Response body too large: {length} bytes")
+            # Content-Length counts the bytes on the wire, so it only bounds
+            # the body when nothing has to be decompressed.
+            encoding = resp.headers.get("Content-Encoding", "identity")
+            if encoding.lower() == "identity" and length <= (cap or MAX_DOWNLOAD_BYTES):
+                return await resp.read()
+
+        buf = bytearray()
+        async for chunk in resp.content.iter_chunked(READ_CHUNK_BYTES):
+            buf += chunk
+            if cap and len(buf) >= cap:
+                del buf[cap:]
+                break
+            if not cap and len(buf) > MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"Response body exceeds {MAX_DOWNLOAD_BYTES} bytes")
+        return bytes(buf)
+
+    @staticmethod
+    def _settle(pages: List[str], results: list, structured: bool = False) -> list:
+        """
+        Resolve gather(..., return_exceptions=True) output for a batch.
+
+        One bad URL no longer throws away the pages that did arrive: each
+        failure is replaced by an error note (or an "error" entry when
+        structured). If every page failed, or the batch was cancelled, the
+        first exception is raised as before.
+
+        Inputs:
+        - pages: requested pages, in the same order as results
+        - results: values and exceptions from gather
+        - structured: emit {"url", "error"} dicts instead of strings
+        Outputs: list of per-page results
+        """
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for err in errors:
+            if not isinstance(err, Exception):
+                raise err  # CancelledError and friends
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        if not errors:
+            return results
+        settled = []
+        for page, result in zip(pages, results):
+            if isinstance(result, Exception):
+                if structured:
+                    result = {"url": page, "error": str(result)}
+                else:
+                    result = f"Error fetching {page}: {result}"
+            settled.append(result)
+        return settled
+
     # ------------------------ Helpers and Aliases ------------------------
     ## Wikipedia
     async def _do_not_call_me(  # Wiki Scrape
@@ -259,18 +1276,17 @@ class Tools:
         Fetch json from wikipedia. returns the English version
         TODO: language valve
         """
-        url = ""
-        if "wikipedia" in page and "api" not in page:
-            # Extract last path segment as title
-            page = page.rsplit("/", 1)[-1]
-            page = urllib.parse.unquote(page)
-            page = page.replace("_", " ")
-
-        page = page.title()  # Title Case for Wikipedia
-        title_param = urllib.parse.quote(page)
         _lang = (lang or self.valves.wiki_lang or "en").strip()
-        url = f"https://{_lang}.wikipedia.org/w/api.php?action=query&prop=extracts&explaintext&format=json&titles={title_param}"
-        return await self.scrape(url=url, return_raw=return_raw, emitter=emitter)
+        url = _wiki_api_url(page, _lang)
+        result = await self.scrape(url=url, return_raw=return_raw, emitter=emitter)
+        if isinstance(result, dict):
+            # Already parsed: hand back the article text itself rather than
+            # the API envelope, so nobody has to dig through it again.
+            pages = (result.get("query") or {}).get("pages") or {}
+            extracts = [p["extract"] for p in pages.values() if p.get("extract")]
+            if extracts:
+                return "\n\n".join(extracts)
+        return result
 
     async def wikipedia(
         self,
@@ -289,7 +1305,9 @@ class Tools:
         - return_raw: True to get raw API JSON; False to summarize API response
         - emitter: optional event sink
 
-        Output: concatenated string of results
+        Pages are fetched concurrently, bounded by the concurrency valve.
+
+        Output: concatenated string of results, in request order
         """
         pages = list(pages or [])
         if page:
@@ -299,13 +1317,22 @@ class Tools:
         if urls:
             pages.extend(urls)
 
-        retval = ""
-        for page in pages:
-            scrape = await self._do_not_call_me(
-                page=page, return_raw=return_raw, emitter=emitter
-            )
-            retval += str(scrape)
-        return retval
+        self._ensure_synced()
+        sem = asyncio.Semaphore(self._concurrency)
+
+        async def process(page: str):
+            async with sem:
+                return await self._do_not_call_me(
+                    page=page, return_raw=return_raw, emitter=emitter
+                )
+
+        # Pages are fetched concurrently; results keep the requested order.
+        results = await asyncio.gather(
+            *[process(p) for p in pages], return_exceptions=True
+        )
+        # Blank line between pages, as scrape() does, so articles don't run
+        # into each other
+        return "\n\n".join(map(str, self._settle(pages, results)))
 
     wikipedia_multi = wikipedia
     wikipedia_pages = wikipedia
@@ -355,14 +1382,15 @@ class Tools:
         if url:
             items.append(url)
 
+        self._ensure_synced()
+
         # Validate allow/block lists
-        allow = self.valves.allow_hosts
-        deny = self.valves.deny_hosts
+        allow = self._allow_hosts
+        deny = self._deny_hosts
         if allow or deny:
             for page in items:
-                parsed = urllib.parse.urlparse(page)
-                host = parsed.hostname
-                if not parsed.scheme or not parsed.netloc:
+                scheme, host = _url_host(page)
+                if not scheme or not host:
                     raise ValueError(f"Invalid URL: {page}")
                 # allowlist takes precedence over blocklist
                 if allow:
@@ -373,13 +1401,17 @@ class Tools:
                 if deny and host in deny:
                     raise ValueError(f"Host blocked: {page}")
 
-        sem = asyncio.Semaphore(max(1, int(self.valves.concurrency) or 1))
+        sem = asyncio.Semaphore(self._concurrency)
 
-        async def process(page: str):
-            async with sem:
+        async def process(page: str, wiki: bool):
+            # Cached pages need no network, so they don't queue behind
+            # fetches for the concurrency slots. Wikipedia pages are cached
+            # under their API URL, so they always take a slot.
+            fresh = not wiki and self._is_fresh(self._cache.get(page))
+            async with contextlib.nullcontext() if fresh else sem:
                 if emitter:
-                    await self._emit(emitter, {"type": "start", "url": page})
-                if redirect and ("wikipedia" in page and "api" not in page):
+                    self._emit_nowait(emitter, {"type": "start", "url": page})
+                if wiki:
                     ret = await self.wikipedia(
                         url=page, return_raw=return_raw, emitter=emitter
                     )
@@ -391,11 +1423,16 @@ class Tools:
                     return {"url": page, "content": ret}
                 return ret
 
-        results = (
-            [await process(p) for p in items]
-            if len(items) <= 1
-            else await asyncio.gather(*[process(p) for p in items])
+        # Each URL is routed once, before any task starts. All pages then
+        # start at once; the semaphore, not the call order, bounds how many
+        # download together.
+        routes = [(p, redirect and _is_wiki_article(p)) for p in items]
+        results = await asyncio.gather(
+            *[process(p, wiki) for p, wiki in routes], return_exceptions=True
         )
+        # Deliver outstanding progress events before handing back results
+        await self._flush_emits()
+        results = self._settle(items, results, structured=return_structured)
         if return_structured:
             return results
         if len(results) == 1:
@@ -417,101 +1454,6 @@ class Tools:
         if url is None:
             raise ValueError("URL cannot be None")
 
-        async def _fetch(self, url: str, emitter=None) -> str:
-            sess = await self._get_session()
-            retries = max(1, int(self.valves.retries))
-            backoff_base = 0.5
-            last_exc = None
-
-            for attempt in range(1, retries + 1):
-                if emitter:
-                    await self._emit(
-                        emitter,
-                        {"type": "fetch_attempt", "attempt": attempt, "url": url},
-                    )
-                try:
-                    async with sess.get(url, timeout=int(self.valves.timeout)) as resp:
-                        max_bytes: int = int(self.valves.max_body_bytes)
-                        # Read with optional size cap
-                        # Determine text vs bytes decoding later
-                        body = await resp.read()
-                        status = resp.status
-                        if status >= 400:
-                            raise aiohttp.ClientResponseError(
-                                resp.request_info,
-                                resp.history,
-                                status=status,
-                                message="bad status",
-                            )
-                        if emitter:
-                            await self._emit(
-                                emitter,
-                                {"type": "fetched", "status": status, "url": url},
-                            )
-                        # apply max_body_bytes
-                        if (
-                            isinstance(max_bytes, int)
-                            and max_bytes > 0
-                            and len(body) > max_bytes
-                        ):
-                            body = body[:max_bytes]
-                        # Decode according to content-type
-                        ctype = resp.headers.get("Content-Type", "")
-                        charset = None
-                        if "charset=" in ctype:
-                            charset = (
-                                ctype.split("charset=", 1)[-1].split(";")[0].strip()
-                            )
-                        text = body.decode(charset or "utf-8", errors="replace")
-                        return text, ctype
-                except Exception as e:
-                    last_exc = e
-                    if attempt < retries:
-                        # status-based retry window
-                        jitter = random.uniform(0, 0.25)
-                        wait = backoff_base * (2 ** (attempt - 1)) + jitter
-                        if emitter:
-                            await self._emit(
-                                emitter,
-                                {
-                                    "type": "fetch_retry",
-                                    "attempt": attempt,
-                                    "wait": wait,
-                                    "error": str(e),
-                                },
-                            )
-                        await asyncio.sleep(wait)
-                    else:
-                        if emitter:
-                            await self._emit(
-                                emitter,
-                                {
-                                    "type": "fetch_failed",
-                                    "attempt": attempt,
-                                    "error": str(e),
-                                },
-                            )
-            raise Exception(f"Failed to fetch {url}: {last_exc}")
-
-        def _clean_html(html):
-            flags = re.S | re.M | re.I
-            # Wikipedia page
-            html = re.sub(r".*Contents.move to sidebar.hide", "", html, flags=flags)
-            # Scripts and headers
-            html = re.sub(r"<head>.*</head>", "", html, flags=flags)
-            html = re.sub(r"<script>.*</script>", "", html, flags=flags)
-            return html
-
-        def _get_all_content(html) -> str:
-            return html2text.html2text(_clean_html(html))
-
-        def _summarize(self, text: str, max_word: int = 2048) -> str:
-            """Simple naive summarizer"""
-            words = re.split(r"\s+", _clean_html(text))
-            return "\n".join("Summary:", " ".join(words[:max_words]))
-
-        # / Helpers
-
         ####################################
         # --- Actual work for scrape() --- #
         ####################################
@@ -519,76 +1461,84 @@ class Tools:
         self._ensure_synced()
 
         try:
-            page_data, content_type = await _fetch(self, url, emitter=emitter)
+            page_data, content_type = await self._fetch(url, emitter=emitter)
         except Exception as e:
             # Emit a clear failure event and avoid caching broken data
             if emitter:
+                await self._flush_emits()
                 await self._emit(
                     emitter,
                     {"type": "fetch_failed_final", "url": url, "error": str(e)},
                 )
             raise e  # re-raise so caller still gets the error
 
-        try:
-            # Prefer header detection if available via simplistic heuristic
-            # Already decoded above; attempt JSON parse
-            json_obj = json.loads(page_data)
-            if emitter:
-                await self._emit(
-                    emitter,
-                    {"type": "found json", "url": url},
-                )
+        kind = _structured_kind(content_type, page_data)
+        if kind == "xml":
+            # return_raw hands the body back as-is, so only parse when the
+            # element itself is going to be returned.
             if not return_raw:
+                try:
+                    if len(page_data) > THREAD_PARSE_BYTES:
+                        return await self._run_blocking(ET.fromstring, page_data)
+                    return ET.fromstring(page_data)
+                except Exception:
+                    pass  # malformed: fall through to the text path
+        elif kind == "json" and not return_raw:
+            # Like XML, only parsed when the object is what gets returned;
+            # return_raw hands back the body unchanged either way.
+            try:
+                if len(page_data) > THREAD_PARSE_BYTES:
+                    json_obj = await self._run_blocking(json_loads, page_data)
+                else:
+                    json_obj = json_loads(page_data)
+                if emitter:
+                    self._emit_nowait(
+                        emitter,
+                        {"type": "found json", "url": url},
+                    )
                 # Return parsed JSON when plaintext is requested
                 return json_obj
-            # Otherwise return_raw = True means return as-is
-        except (json.JSONDecodeError, ValueError):
-            pass
-
-        # Simple XML check via header
-        try:
-            xml_pattern = r"^\s*<\?xml\s"
-            xml_elem = (
-                ET.fromstring(page_data) if re.match(xml_pattern, page_data) else None
-            )
-            if xml_elem is not None:
-                if not return_raw:
-                    # Return parsed XML element when plaintext is requested
-                    return xml_elem
-                    # Otherwise return_raw = True means return as-is
-        except Exception as e:  # pragma: no cover
-            pass
-
-        min_size_check = int(self.valves.min_summary_size) or 0
-        if min_size_check and len(page_data) <= min_size_check:
-            return_raw = True
+            except (json.JSONDecodeError, ValueError):
+                pass
 
         if emitter:
+            await self._flush_emits()
             await self._emit(emitter, {"type": "done", "url": url})
 
-        content = _get_all_content(page_data)
+        # Add header to identify which url this was. Only the variant that
+        # is actually returned gets built.
+        header = f"Contents of url: {url}"
 
-        # Add header to identify which url this was.
-        page_data_with_header = "\n".join([f"Contents of url: {url}", page_data])
-        content_with_header = (
-            "\n".join([f"Contents of url: {url}", content, "\n"])
-            if content and content.strip()
-            else ""
-        )
+        # Pages at or below min_summary_size are always returned raw, so
+        # they never reach the extractor.
+        min_size_check = self._min_summary_size
+        if min_size_check and len(page_data) <= min_size_check:
+            return "\n".join([header, page_data])
 
+        # Raw requests never need the text, so skip the conversion entirely
         if return_raw:
-            return page_data_with_header
+            return "\n".join([header, page_data])
+
+        max_size_check = self._max_summary_size
+        content = None
+        if max_size_check:
+            limit = max(max_size_check * SUMMARY_HTML_RATIO, SUMMARY_HTML_MIN)
+            if len(page_data) > limit:
+                content = await self._page_text(page_data[:limit])
+                if len(content) < max_size_check:
+                    content = None  # mostly markup up front: use it all
+        if content is None:
+            content = await self._page_text(page_data)
 
-        max_size_check = int(self.valves.max_summary_size) or 0
         if max_size_check and len(content) >= max_size_check:
             content = content[:max_size_check]
-            content_with_header = "\n".join([f"Contents of url: {url}", content])
-
-        if content and content.strip():
-            return content_with_header
+            if not content.isspace():
+                return "\n".join([header, content])
+        elif content and not content.isspace():
+            return "\n".join([header, content, "\n"])
 
         # If no content extracted, return the raw page_data with header
-        return page_data_with_header
+        return "\n".join([header, page_data])
 
     get = scrape
     fetch = scrape
@@ -16,6 +16,15 @@ mod.html2text = lambda s: re.sub(r"<[^>]+>", "", s)  # naive strip tags for plai
 sys.modules.setdefault("html2text", mod)
 
 
+class FakeContent:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    async def iter_chunked(self, n: int):
+        for i in range(0, len(self._data), n):
+            yield self._data[i : i + n]
+
+
 class FakeResponse:
     def __init__(
         self,
@@ -30,6 +39,7 @@ class FakeResponse:
         self._text = text
         self._exc = raise_for_status_exc
         self.headers = headers or {"Content-Type": "text/html; charset=utf-8"}
+        self.content = FakeContent(text.encode("utf-8"))
         self.history = []
         self.request_info = types.SimpleNamespace(real_url=url)
 
@@ -52,23 +62,26 @@ class FakeResponse:
 
 class FakeSession:
     def __init__(self, plan: Dict[str, List[Tuple[int, str, Optional[Exception]]]]):
-        """plan: url -> list of (status, text, exc) per call."""
+        """plan: url -> list of (status, text, exc[, headers]) per call."""
         self._plan = {k: list(v) for k, v in plan.items()}
         self.closed = False
         self.headers = {}
         self.seen_urls: List[str] = []
+        self.seen_headers: List[Optional[Dict[str, str]]] = []
 
     async def close(self):
         self.closed = True
 
-    def get(self, url: str, timeout: int = 10):
+    def get(self, url: str, timeout: int = 10, headers=None):
         self.seen_urls.append(url)
+        self.seen_headers.append(headers)
         steps = self._plan.get(url, None)
         if steps is None or len(steps) == 0:
             # default successful response
             return FakeResponse(url, 200, f"<html>OK for {url}</html>")
-        status, body, exc = steps.pop(0)
-        return FakeResponse(url, status, body, exc)
+        status, body, exc, *rest = steps.pop(0)
+        headers = rest[0] if rest else None
+        return FakeResponse(url, status, body, exc, headers=headers)
 
 
 class Emitter:
@@ -1,12 +1,15 @@
 import asyncio
 import importlib
 import json
+import operator
 import re
+import time
 import types
+import urllib.parse
 import pytest
 import aiohttp
 
-from conftest import FakeSession, Emitter
+from conftest import FakeContent, FakeSession, Emitter
 
 
 def with_fake_session(plan):
@@ -147,7 +150,7 @@ async def test_close_and_session_recreation(monkeypatch):
     main = with_fake_session({"https://a.io": [(200, "<html>a</html>", None)]})
     t = main.Tools()
     s1 = await t._get_session()
-    t.valves.user_agent = "UA-NEW"
+    t.valves.connection_limit = 7
     s2 = await t._get_session()
     assert s1 is not s2
     await t.close()
@@ -203,6 +206,10 @@ async def test_emitter_found_json_event(monkeypatch):
     assert isinstance(out, dict) and out["k"] == "v"
     types_seen = [e.get("type") for e in emitter.events]
     assert "found json" in types_seen
+    # raw requests return the body untouched, so it is never parsed
+    main.json_loads = None
+    out = await t.scrape(url="https://json.events", return_raw=True)
+    assert out.endswith(json.dumps({"k": "v"}))
     await t.close()
 
 
@@ -255,9 +262,19 @@ async def test_session_timeout_applied():
     t = main_mod.Tools()
     t.valves.timeout = 2
     s = await t._get_session()
-    assert isinstance(s.timeout, aiohttp.ClientTimeout)
+    assert isinstance(t._timeout, aiohttp.ClientTimeout)
     # aiohttp may store as float
-    assert int(s.timeout.total) == 2
+    assert int(t._timeout.total) == 2
+    # connect phases are capped at the overall timeout
+    assert t._timeout.connect == t._timeout.sock_connect == 2
+    t.valves.timeout = 30
+    # applied per request, so the pool survives the change
+    assert await t._get_session() is s
+    assert t._timeout.connect == main_mod.CONNECT_TIMEOUT
+    assert t._timeout.sock_read == 30
+    t.valves.timeout = None
+    await t._get_session()
+    assert t._timeout is aiohttp.client.DEFAULT_TIMEOUT
     await t.close()
 
 
@@ -295,6 +312,15 @@ async def test_allow_and_deny_hosts_enforced(monkeypatch):
     t.valves.deny_hosts = ["banned.com"]
     out = await t.scrape(url="https://banned.com")
     assert "Bad" in out
+    # entries are case-insensitive and in-place edits are picked up
+    t.valves.allow_hosts = []
+    t.valves.deny_hosts.append("Example.com")
+    with pytest.raises(ValueError, match="blocked"):
+        await t.scrape(url="https://EXAMPLE.com/x")
+    # characters the HTTP client strips can't smuggle a host past the list
+    for sneaky in ["https://exam\nple.com/x", "https://example.com\t/x"]:
+        with pytest.raises(ValueError, match="blocked"):
+            await t.scrape(url=sneaky)
 
 
 def test_ensure_synced_close_when_loop_not_running():
@@ -312,10 +338,14 @@ def test_ensure_synced_close_when_loop_not_running():
 
     d = Dummy()
     t._session = d
-    # flip snapshot so ensure_synced will attempt to close
+    # flip snapshots so ensure_synced will attempt to close
     t._applied_snapshot = None
+    t._session_snapshot = None
     t._ensure_synced()
     assert t._session is None
+    # no loop to close it on here: close() finishes the job later
+    assert d.closed is False
+    asyncio.run(t.close())
     assert d.closed is True
 
 
@@ -402,6 +432,10 @@ async def test_user_agent_header_applied():
     # Call again to exercise early return path
     s2 = await t._get_session()
     assert s2 is s
+    # a new agent is written into the live session, keeping its pool
+    t.valves.user_agent = None
+    assert await t._get_session() is s
+    assert s.headers.get("User-Agent") == main_mod.USER_AGENT
     await t.close()
 
 
@@ -460,40 +494,704 @@ async def test_max_body_bytes_cap(monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_internal_summarize_helper(monkeypatch):
-    """Test the _summarize nested function inside _scrape.
+async def test_wikipedia_multiple_pages_keep_order(monkeypatch):
+    base = "https://en.wikipedia.org/w/api.php?action=query&prop=extracts&explaintext&format=json&titles="
+    plan = {
+        base + "Alpha": [(200, json.dumps({"t": "Alpha"}), None)],
+        base + "Beta": [(200, json.dumps({"t": "Beta"}), None)],
+        base + "Gamma": [(200, json.dumps({"t": "Gamma"}), None)],
+    }
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.concurrency = 2
+    out = await t.wikipedia(pages=["Alpha", "Beta", "Gamma"])
+    assert out.index("Alpha") < out.index("Beta") < out.index("Gamma")
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_repeat_fetch_served_from_cache(monkeypatch):
+    plan = {"https://cached.io": [(200, "<html>first</html>", None)]}
+    main = with_fake_session(plan)
+    t = main.Tools()
+    emitter = Emitter()
+    first = await t.scrape(url="https://cached.io", emitter=emitter)
+    second = await t.scrape(url="https://cached.io", emitter=emitter)
+    assert "first" in first and second == first
+    types_seen = [e.get("type") for e in emitter.events]
+    assert types_seen.count("fetch_attempt") == 1
+    assert "cache_hit" in types_seen
+    # Changing a valve invalidates cached responses
+    t.valves.max_body_bytes = 10_000
+    await t.scrape(url="https://cached.io", emitter=emitter)
+    types_seen = [e.get("type") for e in emitter.events]
+    assert types_seen.count("fetch_attempt") == 2
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_large_json_parsed_off_loop(monkeypatch):
+    payload = {"items": ["x" * 100] * 4000}
+    plan = {"https://bigjson.io": [(200, json.dumps(payload), None)]}
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.max_body_bytes = None
+    assert len(json.dumps(payload)) > main.THREAD_PARSE_BYTES
+    out = await t.scrape(url="https://bigjson.io", return_raw=False)
+    assert out == payload
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_session_uses_tuned_connector():
+    import main as main_mod
+
+    main_mod = importlib.reload(importlib.import_module("main"))
+    t = main_mod.Tools()
+    s = await t._get_session()
+    assert s.connector.limit == main_mod.CONNECTION_LIMIT
+    assert s.connector.limit_per_host == main_mod.CONNECTION_LIMIT_PER_HOST
+    # pool valves are baked into the connector, so changing one rebuilds it
+    t.valves.connection_limit_per_host = 3
+    s2 = await t._get_session()
+    assert s2 is not s and s2.connector.limit_per_host == 3
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_urls_share_one_fetch(monkeypatch):
+    main = with_fake_session({})
+    t = main.Tools()
+    t.valves.cache_ttl = 0  # exercise in-flight sharing, not the cache
+    calls = []
+
+    async def slow_fetch(url, emitter=None):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return "<html>dup</html>", "text/html"
+
+    t._fetch_with_retries = slow_fetch
+    out = await t.scrape(urls=["https://dup.io"] * 3)
+    assert out.count("dup</html>") == 3
+    assert calls == ["https://dup.io"]
+    assert t._inflight == {}
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_uncapped_body_over_ceiling_rejected(monkeypatch):
+    plan = {"https://huge.io": [(200, "<html>" + "x" * 500 + "</html>", None)]}
+    main = with_fake_session(plan)
+    main.MAX_DOWNLOAD_BYTES = 100
+    t = main.Tools()
+    t.valves.max_body_bytes = None
+    t.valves.retries = 1
+    with pytest.raises(Exception, match="exceeds 100 bytes"):
+        await t.scrape(url="https://huge.io")
+    await t.close()
+
+
+def test_accept_encoding_matches_available_decoders():
+    from aiohttp import compression_utils
+
+    import main as main_mod
+
+    main_mod = importlib.reload(importlib.import_module("main"))
+    advertised = [e.strip() for e in main_mod.HEADERS["Accept-Encoding"].split(",")]
+    assert ("br" in advertised) == compression_utils.HAS_BROTLI
+    assert ("zstd" in advertised) == getattr(compression_utils, "HAS_ZSTD", False)
+    assert "gzip" in advertised
+
+
+@pytest.mark.asyncio
+async def test_per_host_concurrency_limit(monkeypatch):
+    main = with_fake_session({})
+    t = main.Tools()
+    t.valves.per_host_concurrency = 2
+    t.valves.concurrency = 10
+    active = {"now": 0, "peak": 0}
+
+    async def fake_fetch(url, emitter=None):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return f"<html>{url}</html>", "text/html"
+
+    t._fetch_with_retries = fake_fetch
+    await t.scrape(urls=[f"https://one.host/{i}" for i in range(6)])
+    assert active["peak"] == 2
+    # idle hosts don't keep a semaphore around
+    assert not t._host_sems
+    async with t._host_slot("https://one.host/x"):
+        # unrelated valve edits keep the semaphores a running batch holds
+        entry = t._host_sems["one.host"]
+        t.valves.retries = 5
+        t._ensure_synced()
+        assert t._host_sems["one.host"] is entry
+        t.valves.per_host_concurrency = 3
+        t._ensure_synced()
+        assert not t._host_sems
+        async with t._host_slot("https://one.host/y"):
+            assert t._host_sems["one.host"] is not entry
+    assert not t._host_sems
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(monkeypatch):
+    main = with_fake_session({})
+    t = main.Tools()
+    t.valves.cache_size = 2
+    await t.scrape(url="https://a.io")
+    await t.scrape(url="https://b.io")
+    await t.scrape(url="https://a.io")  # hit: a becomes most recent
+    await t.scrape(url="https://c.io")  # evicts b
+    assert list(t._cache) == ["https://a.io", "https://c.io"]
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_bounded_by_total_size(monkeypatch):
+    main = with_fake_session({})
+    t = main.Tools()
+
+    async def fetch(url, emitter=None):
+        return "x" * 40, "text/html"
+
+    t._fetch_with_retries = fetch
+    monkeypatch.setattr(main, "CACHE_MAX_CHARS", 100)
+    for host in ("a", "b", "c"):
+        await t.scrape(url=f"https://{host}.io")
+    assert list(t._cache) == ["https://b.io", "https://c.io"]
+    assert t._cache_chars == 80
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_expired_before_live(monkeypatch):
+    main = with_fake_session({})
+    t = main.Tools()
+    t.valves.cache_size = 2
+    await t.scrape(url="https://old.io")
+    await t.scrape(url="https://stale.io")
+    # age the most recently used entry past the TTL
+    ts, ttl, digest, value = t._cache["https://stale.io"]
+    t._cache["https://stale.io"] = (ts - ttl - 1, ttl, digest, value)
+    await t.scrape(url="https://new.io")
+    assert list(t._cache) == ["https://old.io", "https://new.io"]
+    # the full sweep is amortized: the next eviction just drops the LRU head
+    assert t._sweep_countdown == 2
+    await t.scrape(url="https://newer.io")
+    assert list(t._cache) == ["https://new.io", "https://newer.io"]
+    assert t._sweep_countdown == 1
+    await t.close()
+
+
+def test_entry_ttl_adapts_to_content_and_changes():
+    import main as main_mod
+
+    main_mod = importlib.reload(importlib.import_module("main"))
+    entry_ttl = main_mod.Tools._entry_ttl
+    factor = main_mod.STRUCTURED_TTL_FACTOR
+    assert entry_ttl(100, "text/html", 1, None) == 100
+    assert entry_ttl(100, "application/json", 1, None) == 100 * factor
+    # body changed since the last fetch: TTL halves
+    prev = (0.0, 100, 1, None)
+    assert entry_ttl(100, "text/html", 2, prev) == 50
+    # unchanged: TTL grows back, capped at the starting value
+    prev = (0.0, 50, 1, None)
+    assert entry_ttl(100, "text/html", 1, prev) == 100
+    prev = (0.0, 100, 1, None)
+    assert entry_ttl(100, "text/html", 1, prev) == 100
+
+
+@pytest.mark.asyncio
+async def test_unrelated_valve_change_keeps_session():
+    import main as main_mod
+
+    main_mod = importlib.reload(importlib.import_module("main"))
+    t = main_mod.Tools()
+    s1 = await t._get_session()
+    t.valves.max_summary_size = 4096
+    t.valves.concurrency = 2
+    s2 = await t._get_session()
+    assert s1 is s2 and not s1.closed
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_binary_content_type_rejected_without_retry(monkeypatch):
+    plan = {
+        "https://img.io/cat.png": [
+            (200, "\x89PNG", None, {"Content-Type": "image/png"}),
+        ]
+    }
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.retries = 3
+    emitter = Emitter()
+    with pytest.raises(Exception, match="Unsupported content type"):
+        await t.scrape(url="https://img.io/cat.png", emitter=emitter)
+    attempts = [e for e in emitter.events if e.get("type") == "fetch_attempt"]
+    assert len(attempts) == 1
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_repeat_summary_reuses_extracted_text():
+    body = "<html><body><p>" + "word " * 400 + "</p></body></html>"
+    plan = {"https://memo.io": [(200, body, None)]}
+    main = with_fake_session(plan)
+    t = main.Tools()
+    calls = []
+    convert = main._get_all_content
+    main._get_all_content = lambda html: calls.append(html) or convert(html)
+    first = await t.scrape(url="https://memo.io", return_raw=False)
+    t._cache.clear()  # refetch: same body, new str object
+    second = await t.scrape(url="https://memo.io", return_raw=False)
+    assert first == second
+    assert len(calls) == 1 and len(t._text_cache) == 1
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_cached_url_skips_concurrency_queue():
+    main = with_fake_session({})
+    t = main.Tools()
+    t.valves.concurrency = 1
+    released = asyncio.Event()
+
+    async def fetch(url, emitter=None):
+        if "cold" in url:
+            await released.wait()
+        return f"<html>{url}</html>", "text/html"
+
+    t._fetch_with_retries = fetch
+    await t.scrape(url="https://hot.io")
+
+    class Releaser(Emitter):
+        async def emit(self, event):
+            await super().emit(event)
+            if event == {"type": "done", "url": "https://hot.io"}:
+                released.set()
+
+    # cold.io takes the only slot first; hot.io must not wait behind it
+    out = await asyncio.wait_for(
+        t.scrape(urls=["https://cold.io", "https://hot.io"], emitter=Releaser()), 2
+    )
+    assert "cold.io" in out and "hot.io" in out
+    await t.close()
+
+
+def test_structured_kind_dispatch():
+    main = importlib.import_module("main")
+    kind = main._structured_kind
+    # declared media types skip the sniff
+    assert kind("application/json; charset=utf-8", "") == "json"
+    assert kind("application/rss+xml", "<rss/>") == "xml"
+    # html/generic types fall back to sniffing the body
+    assert kind("text/html", ' {"a": 1}') == "json"
+    assert kind("text/plain", '<?xml version="1.0"?><a/>') == "xml"
+    assert kind("text/html", "<html></html>") is None
+    # XHTML is a page even with an XML declaration
+    assert kind("application/xhtml+xml", '<?xml version="1.0"?><html/>') is None
+
+
+@pytest.mark.asyncio
+async def test_cache_survives_unrelated_valve_change():
+    main = with_fake_session({})
+    t = main.Tools()
+    for host in ("a", "b", "c"):
+        await t.scrape(url=f"https://{host}.io")
+    t.valves.concurrency = 3
+    t.valves.cache_size = 2
+    t._ensure_synced()
+    assert list(t._cache) == ["https://b.io", "https://c.io"]
+    # a new user agent keeps the cache; a new cache_ttl rescales each TTL
+    ttl = t._cache["https://b.io"][1]
+    t.valves.user_agent = "Other/1.0"
+    t.valves.cache_ttl *= 2
+    t._ensure_synced()
+    assert list(t._cache) == ["https://b.io", "https://c.io"]
+    assert t._cache["https://b.io"][1] == ttl * 2
+    t.valves.max_body_bytes = 1024
+    t._ensure_synced()
+    assert not t._cache
+    await t.scrape(url="https://a.io")
+    t.valves.cache_ttl = 0
+    t._ensure_synced()
+    assert not t._cache
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_body_cap_sent_as_range_hint():
+    plan = {"https://empty.io": [(416, "", None)]}
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.max_body_bytes = 100
+    out = await t.scrape(url="https://empty.io", return_raw=True)
+    assert out.strip() == "Contents of url: https://empty.io"
+    assert t._session.seen_headers == [{"Range": "bytes=0-99"}]
+    t.valves.max_body_bytes = None
+    await t.scrape(url="https://other.io")
+    assert t._session.seen_headers == [None]
+    await t.close()
+
+
+def test_wiki_routing_by_host():
+    main = importlib.import_module("main")
+    assert main._is_wiki_article("https://en.wikipedia.org/wiki/Rapid")
+    assert main._is_wiki_article("https://de.m.wikipedia.org/wiki/Berlin")
+    assert not main._is_wiki_article(
+        "https://en.wikipedia.org/w/api.php?action=query&titles=X"
+    )
+    assert not main._is_wiki_article("https://example.com/?q=wikipedia")
+    assert not main._is_wiki_article("https://notwikipedia.org/wiki/X")
+
+
+def test_url_host_fast_path_matches_urllib():
+    main = importlib.import_module("main")
+    for url in [
+        "https://Example.COM/a?b#c",
+        "http://example.com:8080",
+        "https://example.com?x=/y",
+        "https://user:pw@example.com/",
+        "http://[::1]:8000/x",
+        "ftp://files.example.com/f",
+        "not a url",
+        # urllib (and aiohttp) drop tabs/newlines and leading blanks
+        "https://bann\ned.com/x",
+        "https://banned.com\t/x",
+        "https://banned.com\r\n/x",
+        " https://banned.com/x",
+        "\x00https://banned.com",
+    ]:
+        parts = urllib.parse.urlsplit(url)
+        assert main._url_host(url) == (parts.scheme, parts.hostname or "")
+
+
+def test_clean_html_patterns():
+    main = importlib.import_module("main")
+    html = (
+        '<head><title>t</title></head><script src="a.js"></script>'
+        "<p>keep</p><script>x()</script><p>also</p>"
+    )
+    assert main._clean_html(html) == "<p>keep</p><p>also</p>"
+    wiki = "nav junk Contents move to sidebar hide Body text"
+    assert main._clean_html(wiki) == " Body text"
+    # a miss on a large page must stay linear
+    assert main.WIKI_PREAMBLE_RE.search("<p>x</p>" * 20000) is None
+
+
+@pytest.mark.asyncio
+async def test_wikipedia_summary_returns_extract_text():
+    api_url = "https://en.wikipedia.org/w/api.php?action=query&prop=extracts&explaintext&format=json&titles=Alan%20Turing"
+    body = json.dumps({"query": {"pages": {"1": {"extract": "Turing was..."}}}})
+    main = with_fake_session({api_url: [(200, body, None)]})
+    t = main.Tools()
+    out = await t.wikipedia(page="Alan Turing", return_raw=False)
+    assert out == "Turing was..."
+    await t.close()
+
+
+def test_wiki_api_url_memoized_per_language():
+    main = importlib.import_module("main")
+    main._wiki_api_url.cache_clear()
+    en = main._wiki_api_url("https://en.wikipedia.org/wiki/Caf%C3%A9", "en")
+    assert en.startswith("https://en.wikipedia.org/") and en.endswith("Caf%C3%A9")
+    assert main._wiki_api_url("https://en.wikipedia.org/wiki/Caf%C3%A9", "en") == en
+    assert main._wiki_api_url("Café", "fr").startswith("https://fr.wikipedia.org/")
+    assert main._wiki_api_url.cache_info().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_fail_fast_but_429_retries():
+    plan = {
+        "https://gone.io": [(404, "missing", None)] * 3,
+        "https://busy.io": [
+            (429, "slow down", None, {"Retry-After": "0"}),
+            (200, "<html>ok</html>", None),
+        ],
+    }
+    main = with_fake_session(plan)
+    main.BACKOFF_BASE = 0.01
+    t = main.Tools()
+    t.valves.retries = 3
+    emitter = Emitter()
+    with pytest.raises(Exception, match="404"):
+        await t.scrape(url="https://gone.io", emitter=emitter)
+    attempts = [e for e in emitter.events if e.get("type") == "fetch_attempt"]
+    assert len(attempts) == 1
+    emitter = Emitter()
+    assert "ok" in await t.scrape(url="https://busy.io", emitter=emitter)
+    # Retry-After replaces the (jittered) backoff
+    assert [e["wait"] for e in emitter.events if e["type"] == "fetch_retry"] == [0]
+    await t.close()
 
-    Note: _summarize is currently defined but not used in the codebase.
-    This test accesses it by creating HTML with many words and checking
-    that it would truncate correctly if it were called.
-    """
+
+def test_retry_after_parsing():
     import main as main_mod
-    import re
-
-    # Create a simple test of the _summarize logic
-    # Since _summarize is a nested function, we'll test the logic directly
-    def _clean_html(html):
-        flags = re.S | re.M | re.I
-        html = re.sub(r".*Contents.move to sidebar.hide", "", html, flags=flags)
-        html = re.sub(r"<head>.*</head>", "", html, flags=flags)
-        html = re.sub(r"<script>.*</script>", "", html, flags=flags)
-        return html
-
-    def _summarize(text: str, max_words=2048) -> str:
-        """Simple naive summarizer (replica of internal function)"""
-        words = re.split(r"\s+", _clean_html(text))
-        return " ".join(words[:max_words])
-
-    # Test with HTML containing many words
-    long_html = (
-        "<html><body>"
-        + (" ".join([f"word{i}" for i in range(3000)]))
-        + "</body></html>"
+
+    assert main_mod._retry_after({"Retry-After": " 7 "}) == 7
+    assert main_mod._retry_after({"Retry-After": "soon"}) is None
+    assert main_mod._retry_after({}) is None
+    past = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert main_mod._retry_after({"Retry-After": past}) == 0
+    assert main_mod._retry_after({"Retry-After": "\u00b2"}) is None
+    # naive "-0000" dates are UTC, not local time
+    soon = time.time() + 60
+    stamp = time.strftime("%a, %d %b %Y %H:%M:%S -0000", time.gmtime(soon))
+    assert 50 < main_mod._retry_after({"Retry-After": stamp}) <= 60
+
+
+@pytest.mark.asyncio
+async def test_progress_events_delivered_in_order():
+    main = with_fake_session({})
+    t = main.Tools()
+
+    class SlowEmitter(Emitter):
+        async def emit(self, event):
+            # later events would overtake earlier ones if each got its own task
+            await asyncio.sleep(0.01 if event["type"] == "start" else 0)
+            await super().emit(event)
+
+    emitter = SlowEmitter()
+    await t.scrape(url="https://order.io", emitter=emitter)
+    seen = [e["type"] for e in emitter.events]
+    assert seen[:3] == ["start", "fetch_attempt", "fetched"]
+    assert seen[-1] == "done"
+    await t.close()
+    assert t._emit_worker is None
+
+
+@pytest.mark.asyncio
+async def test_raw_scrape_skips_text_conversion():
+    body = "<html><body>" + "x " * 2000 + "</body></html>"
+    main = with_fake_session({"https://raw.io": [(200, body, None)]})
+    t = main.Tools()
+    t.valves.max_body_bytes = None
+    out = await t.scrape(url="https://raw.io", return_raw=True)
+    assert out.endswith(body)
+    assert not t._text_cache
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_one_failed_url_keeps_the_rest_of_the_batch():
+    plan = {
+        "https://ok.io": [(200, "<html>fine</html>", None)] * 2,
+        "https://gone.io": [(404, "missing", None)] * 2,
+    }
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.cache_ttl = 0
+    out = await t.scrape(urls=["https://ok.io", "https://gone.io"])
+    assert "fine" in out and "Error fetching https://gone.io" in out
+    res = await t.scrape(
+        urls=["https://ok.io", "https://gone.io"], return_structured=True
     )
-    result = _summarize(long_html, max_words=100)
-    word_count = len([w for w in result.split() if w])
+    assert res[0]["url"] == "https://ok.io" and "fine" in res[0]["content"]
+    assert res[1]["url"] == "https://gone.io" and "404" in res[1]["error"]
+    await t.close()
 
-    # Should truncate to max_words (100) or fewer
-    assert word_count <= 100
-    assert "word0" in result
-    assert "word99" in result or word_count < 100
+
+@pytest.mark.asyncio
+async def test_expired_entry_revalidated_with_etag():
+    page = "<html>cached body</html>"
+    etag = {"Content-Type": "text/html", "ETag": '"v1"'}
+    plan = {"https://etag.io": [(200, page, None, etag), (304, "", None)]}
+    main = with_fake_session({})
+    t = main.Tools()
+    sess = FakeSession(plan)
+
+    async def get_session():
+        return sess
+
+    t._get_session = get_session
+    assert page in await t.scrape(url="https://etag.io")
+    ts, ttl, digest, value = t._cache["https://etag.io"]
+    t._cache["https://etag.io"] = (ts - ttl - 1, ttl, digest, value)
+    emitter = Emitter()
+    assert page in await t.scrape(url="https://etag.io", emitter=emitter)
+    assert sess.seen_headers[1]["If-None-Match"] == '"v1"'
+    assert "not_modified" in [e["type"] for e in emitter.events]
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_parse_processes_falls_back_to_threads():
+    # spawned workers import main afresh, which needs a real converter
+    pytest.importorskip("lxml")
+    body = "<html><body><p>" + "word " * 400 + "</p></body></html>"
+    main = with_fake_session({"https://proc.io": [(200, body, None)]})
+    main.PROCESS_PARSE_BYTES = 0
+    t = main.Tools()
+    t.valves.parse_processes = True
+    t.valves.max_body_bytes = None
+    try:
+        out = await t.scrape(url="https://proc.io", return_raw=False)
+        assert "word word" in out
+        pool = main._process_pool
+        assert pool._mp_context.get_start_method() == "spawn"
+        # an error raised by the converter itself leaves the pool in service
+        main._get_all_content = operator.attrgetter("missing")
+        with pytest.raises(AttributeError):
+            await t._page_text("<p>boom</p>")
+        assert main._process_pool is pool
+        # a converter that can't be pickled disables the pool for good
+        main._get_all_content = lambda html: "converted"
+        assert await t._page_text("<p>other</p>") == "converted"
+        assert main._process_pool is False
+    finally:
+        # don't leak spawned workers into the rest of the suite
+        main.Tools._disable_process_pool()
+        await t.close()
+
+
+@pytest.mark.asyncio
+async def test_summary_converts_only_a_prefix_of_long_pages():
+    text_page = "<html><body><p>" + "word " * 40000 + "</p></body></html>"
+    script_page = (
+        "<html><head><script>" + "x" * 200000 + "</script></head>"
+        "<body><p>late text</p></body></html>"
+    )
+    plan = {
+        "https://long.io": [(200, text_page, None)],
+        "https://late.io": [(200, script_page, None)],
+    }
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.max_body_bytes = None
+    seen = []
+    page_text = t._page_text
+
+    async def spy(html):
+        seen.append(len(html))
+        return await page_text(html)
+
+    t._page_text = spy
+    out = await t.scrape(url="https://long.io", return_raw=False)
+    assert seen == [main.SUMMARY_HTML_MIN] and "word word" in out
+    seen.clear()
+    # a prefix that is all script falls back to the whole page
+    out = await t.scrape(url="https://late.io", return_raw=False)
+    assert seen == [main.SUMMARY_HTML_MIN, len(script_page)]
+    assert "late text" in out
+    await t.close()
+
+
+@pytest.mark.asyncio
+async def test_body_within_content_length_read_at_once(monkeypatch):
+    body = "<html>" + "x" * 500 + "</html>"
+    size = {"Content-Type": "text/html", "Content-Length": str(len(body))}
+    plan = {
+        "https://plain.io": [(200, body, None, size)],
+        "https://gz.io": [(200, body, None, {**size, "Content-Encoding": "gzip"})],
+    }
+    main = with_fake_session(plan)
+    t = main.Tools()
+    t.valves.max_body_bytes = 1000
+    reads = []
+
+    async def no_chunks(self, n):
+        reads.append("chunked")
+        yield self._data
+
+    monkeypatch.setattr(FakeContent, "iter_chunked", no_chunks)
+    assert (await t.scrape(url="https://plain.io")).endswith(body)
+    assert reads == []
+    # compressed: the wire length says nothing about the decoded size
+    assert (await t.scrape(url="https://gz.io")).endswith(body)
+    assert reads == ["chunked"]
+    await t.close()
+
+
+def test_lxml_tier_handles_xhtml_and_empty_documents(monkeypatch):
+    pytest.importorskip("lxml")
+    main = importlib.reload(importlib.import_module("main"))
+    monkeypatch.setattr(main, "HTMLParser", None)
+    xhtml = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><body><p>hi</p></body></html>'
+    )
+    assert main._get_all_content(xhtml) == "hi"
+    for empty in ["", "  ", "<!-- only a comment -->", '<?xml version="1.0"?>']:
+        assert main._get_all_content(empty) == ""
+
+
+@pytest.mark.asyncio
+async def test_raw_scrape_never_imports_html2text(monkeypatch):
+    import sys
+
+    monkeypatch.delitem(sys.modules, "html2text")
+    main = with_fake_session({})
+    t = main.Tools()
+    t.valves.min_summary_size = 0
+    assert (await t.scrape(url="https://raw.io", return_raw=True)).endswith("</html>")
+    assert "html2text" not in sys.modules
+    await t.close()
+
+
+class FakeLexbor:
+    """Just enough of selectolax's parser API for _get_all_content."""
+
+    stripped = None
+
+    def __init__(self, html):
+        self.html = html
+
+    def strip_tags(self, tags):
+        FakeLexbor.stripped = list(tags)
+        pattern = r"<(%s)\b.*?</\1>" % "|".join(tags)
+        self.html = re.sub(pattern, "", self.html, flags=re.S)
+
+    @property
+    def body(self):
+        m = re.search(r"<body>(.*)</body>", self.html, re.S)
+        if m is None:
+            return None
+        words = re.sub(r"<[^>]+>", " ", m.group(1)).split()
+        return types.SimpleNamespace(
+            text=lambda separator, strip: separator.join(words)
+        )
+
+
+LEXBOR_PAGE = (
+    "<html><head><title>T</title></head><body>Nav Contents move to sidebar hide"
+    "<p>Real</p><script>bad()</script><style>x{}</style><noscript>ns</noscript>"
+    " text</body></html>"
+)
+
+
+def test_lexbor_tier_strips_non_text_and_wiki_preamble(monkeypatch):
+    main = importlib.reload(importlib.import_module("main"))
+    monkeypatch.setattr(main, "HTMLParser", FakeLexbor)
+    assert main._get_all_content(LEXBOR_PAGE) == " Real text"
+    assert FakeLexbor.stripped == main.NON_TEXT_TAGS
+    assert main._get_all_content("<html></html>") == ""
+
+
+def test_lexbor_tier_with_selectolax():
+    pytest.importorskip("selectolax")
+    main = importlib.reload(importlib.import_module("main"))
+    assert main._get_all_content(LEXBOR_PAGE) == " Real text"
+
+
+@pytest.mark.asyncio
+async def test_wikipedia_pages_are_separated():
+    def api(title, text):
+        url = (
+            "https://en.wikipedia.org/w/api.php?action=query&prop=extracts"
+            f"&explaintext&format=json&titles={title}"
+        )
+        body = json.dumps({"query": {"pages": {"1": {"extract": text}}}})
+        return url, [(200, body, None, {"Content-Type": "application/json"})]
+
+    plan = dict([api("A", "End of A."), api("B", "Start of B.")])
+    main = with_fake_session(plan)
+    t = main.Tools()
+    out = await t.wikipedia(pages=["A", "B"], return_raw=False)
+    assert out == "End of A.\n\nStart of B."
+    await t.close()